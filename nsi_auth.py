@@ -11,15 +11,34 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 """Verify DN from HTTP header against list of allowed DN's."""
+import contextlib
+import logging
+import os
+import sys
 import threading
+from collections.abc import Iterable
 from logging.config import dictConfig
-from typing import Callable
+from pathlib import Path
+from typing import Any, Callable, ClassVar
+from wsgiref.types import StartResponse, WSGIApplication, WSGIEnvironment
 
-from flask import Flask, request
-from pydantic import BaseModel, FilePath
-from pydantic_settings import BaseSettings
-from watchdog.events import FileModifiedEvent, FileSystemEvent, FileSystemEventHandler
+from flask import Flask
+from pydantic import FilePath, NonNegativeFloat, PositiveFloat, field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+from watchdog.events import (
+    DirMovedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+    FileSystemEvent,
+    FileSystemEventHandler,
+)
 from watchdog.observers import Observer
+from watchdog.observers.api import BaseObserver, ObservedWatch
+
+try:
+    from inotify_simple import INotify, flags  # type: ignore[import-untyped]
+except ImportError:
+    INotify = None
 
 
 #
@@ -28,16 +47,25 @@ from watchdog.observers import Observer
 class Settings(BaseSettings):
     """Application settings."""
 
+    model_config = SettingsConfigDict(frozen=True)
+
     allowed_client_subject_dn_path: FilePath = FilePath("/config/allowed_client_dn.txt")
     ssl_client_subject_dn_header: str = "ssl-client-subject-dn"
     use_watchdog: bool = False
+    use_inotify: bool = True
     log_level: str = "INFO"
+    allow_log_level: str = "DEBUG"
+    watch_interval_seconds: PositiveFloat = 60.0
+    dn_normalize: bool = False
+    watchdog_debounce_seconds: NonNegativeFloat = 0.2
 
-
-class State(BaseModel):
-    """Application state."""
-
-    allowed_client_subject_dn: list[str] = []
+    @field_validator("allow_log_level")
+    @classmethod
+    def validate_allow_log_level(cls, value: str) -> str:
+        """Check that `allow_log_level` is a known log level name."""
+        if (value := value.upper()) not in logging.getLevelNamesMapping():
+            raise ValueError(f"unknown log level {value}")
+        return value
 
 
 def init_app() -> Flask:
@@ -62,58 +90,168 @@ def init_app() -> Flask:
         }
     )
     app = Flask(__name__)
+    app.debug = False
+    app.testing = False
     app.logger.setLevel(settings.log_level)
 
     return app
 
 
 settings = Settings()
-state = State()
+_HEADER: str = settings.ssl_client_subject_dn_header
+_HTTP_KEY: str = "HTTP_" + _HEADER.upper().replace("-", "_")
+_DN_NORMALIZE: bool = settings.dn_normalize
+_ALLOW_LOG_LEVEL: int = logging.getLevelNamesMapping()[settings.allow_log_level]
+# Application state, each held in a single slot that is replaced as a whole, so concurrent readers
+# always see either the old or the new immutable value, also on free-threaded Python.
+allowed_client_subject_dn: list[frozenset[str]] = [frozenset()]
+allowed_client_subject_dn_stat: list[tuple[int, int] | None] = [None]
+# serializes loads, so a slower older load cannot publish its stale set and stat after a newer one
+allowed_client_subject_dn_lock = threading.Lock()
 app = init_app()
 
 
-@app.route("/validate", methods=["GET"])
-def validate() -> tuple[str, int]:
-    """Verify the DN from the packet header against the list of allowed DN."""
-    if not (dn := request.headers.get(settings.ssl_client_subject_dn_header)):
-        app.logger.warning(f"no {settings.ssl_client_subject_dn_header} header on HTTP request")
-        return "Forbidden", 403
-    if dn not in state.allowed_client_subject_dn:
-        app.logger.info(f"deny {dn}")
-        return "Forbidden", 403
-    app.logger.info(f"allow {dn}")
-    return "OK", 200
+def wsgi_str(value: str) -> str:
+    """Return `value` the way WSGI passes header values, as UTF-8 bytes decoded as latin-1."""
+    return value.encode().decode("latin-1")
+
+
+def validate(environ: WSGIEnvironment) -> tuple[str, bytes]:
+    """Verify the DN from the packet header against the set of allowed DN."""
+    if not (dn := environ.get(_HTTP_KEY)):
+        app.logger.warning("no %s header on HTTP request", _HEADER)
+        return "403 FORBIDDEN", b"Forbidden"
+    if _DN_NORMALIZE:
+        dn = wsgi_str(dn.encode("latin-1").decode(errors="replace").strip().casefold())
+    if dn not in allowed_client_subject_dn[0]:
+        app.logger.info("deny %s", dn)
+        return "403 FORBIDDEN", b"Forbidden"
+    if app.logger.isEnabledFor(_ALLOW_LOG_LEVEL):
+        app.logger.log(_ALLOW_LOG_LEVEL, "allow %s", dn)
+    return "200 OK", b"OK"
+
+
+class ValidateMiddleware:
+    """Answer /validate straight from the WSGI environ, pass all other requests on to Flask."""
+
+    def __init__(self, wsgi_app: WSGIApplication) -> None:
+        """Set the WSGI application to pass other requests on to."""
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ: WSGIEnvironment, start_response: StartResponse) -> Iterable[bytes]:
+        """Call validate() for /validate without going through Flask routing and request context."""
+        if environ.get("PATH_INFO") != "/validate":
+            return self.wsgi_app(environ, start_response)
+        method = environ.get("REQUEST_METHOD")
+        if method in ("GET", "HEAD"):
+            status, body = validate(environ)
+            headers = []
+        elif method == "OPTIONS":
+            status, body = "200 OK", b""
+            headers = [("Allow", "GET, HEAD, OPTIONS")]
+        else:
+            status, body = "405 METHOD NOT ALLOWED", b"Method Not Allowed"
+            headers = [("Allow", "GET, HEAD, OPTIONS")]
+        headers += [("Content-Type", "text/plain; charset=utf-8"), ("Content-Length", str(len(body)))]
+        start_response(status, headers)
+        return [b""] if method == "HEAD" else [body]
+
+
+app.wsgi_app = ValidateMiddleware(app.wsgi_app)  # type: ignore[method-assign]
 
 
 #
 # File watch based on watchdog.
 #
+def symlink_chain(path: str) -> frozenset[str]:
+    """Return `path` and all symlinks, to files or directories, that are followed when resolving it."""
+    chain = {path}
+    for _ in range(40):  # same limit on followed symlinks as Linux
+        # a symlinked directory in the path, like the ..data symlink of a Kubernetes ConfigMap
+        chain.update(str(parent) for parent in Path(path).parents if parent.is_symlink())
+        if not Path(path).is_symlink():
+            break
+        path = os.path.normpath(Path(path).parent / Path(path).readlink())
+        chain.add(path)
+    return frozenset(chain)
+
+
 class FileChangeHandler(FileSystemEventHandler):
-    """On filesystem event, call load_allowed_client_dn() when `filepath` is modified."""
+    """On filesystem event, call load_allowed_client_dn() when `filepath` is modified or replaced."""
 
-    def __init__(self, filepath: FilePath, callback: Callable[[FilePath], None]) -> None:
-        """Set the filepath of the file to watch."""
+    event_filter: ClassVar[list[type[FileSystemEvent]]] = [FileModifiedEvent, FileMovedEvent, DirMovedEvent]
+
+    def __init__(self, filepath: FilePath, callback: Callable[[FilePath], None], observer: BaseObserver) -> None:
+        """Set the filepath of the file to watch and resolve where it points to."""
         self.filepath = filepath
+        self.path = os.fspath(filepath)
+        self.parent_realpath = os.path.realpath(filepath.parent)
         self.callback = callback
-        load_allowed_client_dn(self.filepath)
-        app.logger.info(f"watch {self.filepath} for changes")
+        self.observer = observer
+        self.target_watch: ObservedWatch | None = None
+        self.timer: threading.Timer | None = None
+        self.resolve()
+
+    def resolve(self) -> None:
+        """Cache the real path and symlink chain of `filepath`, and watch the directory of its real path."""
+        self.realpath = os.path.realpath(self.path)
+        self.paths = frozenset((self.path, self.realpath))
+        self.names = frozenset(path.rpartition(os.sep)[2] for path in self.paths)
+        self.moved_paths = symlink_chain(self.path) | self.paths
+        target_dir = os.path.dirname(self.realpath)  # noqa: PTH120
+        if self.target_watch is not None:
+            if self.target_watch.path == target_dir:
+                return
+            self.observer.unschedule(self.target_watch)
+            self.target_watch = None
+        if target_dir != self.parent_realpath:
+            app.logger.info("watch %s for changes", self.realpath)
+            self.target_watch = self.observer.schedule(self, target_dir, event_filter=self.event_filter)
 
     def on_modified(self, event: FileSystemEvent) -> None:
-        """Call load_allowed_client_dn() when `filepath` is modified."""
-        app.logger.debug(f"on_modified {event} {FilePath(str(event.src_path)).resolve()} {self.filepath.resolve()}")
-        if FilePath(str(event.src_path)).resolve() == self.filepath.resolve():
-            self.callback(self.filepath)
+        """Call load_allowed_client_dn() when `filepath` is modified and no further changes follow shortly."""
+        app.logger.debug("on_modified %s %s", event, self.filepath)
+        src_path = os.fsdecode(event.src_path)
+        if src_path in self.paths:
+            self.schedule_callback()
+            return
+        # only stat files with the same name, that may be `filepath` reached through another path
+        if src_path.rpartition(os.sep)[2] not in self.names:
+            return
+        try:
+            is_filepath = self.filepath.samefile(src_path)
+        except OSError:
+            return
+        if is_filepath:
+            self.schedule_callback()
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        """Call load_allowed_client_dn() when `filepath` or a symlink on the way to it is replaced.
+
+        This catches editors that save by renaming a temporary file over `filepath`, and Kubernetes ConfigMap
+        updates that atomically rename the ..data symlink.
+        """
+        app.logger.debug("on_moved %s %s", event, self.filepath)
+        if os.fsdecode(event.dest_path) in self.moved_paths:
+            self.resolve()
+            self.schedule_callback()
+
+    def schedule_callback(self) -> None:
+        """Call back after `watchdog_debounce_seconds`, a single write can cause multiple events."""
+        if self.timer is not None:
+            self.timer.cancel()
+        self.timer = threading.Timer(settings.watchdog_debounce_seconds, self.callback, args=(self.filepath,))
+        self.timer.daemon = True
+        self.timer.start()
 
 
 def watchdog_file(filepath: FilePath, callback: Callable[[FilePath], None]) -> None:
-    """Setup watchdog to watch directory that the file resides in and call handler on change."""
+    """Setup watchdog to watch directory that the file and its symlink target reside in and call handler on change."""
+    app.logger.info("watch %s for changes", filepath)
+    callback(filepath)
     observer = Observer()
-    observer.schedule(
-        FileChangeHandler(filepath, callback),
-        path=str(filepath.parent),
-        recursive=True,
-        event_filter=[FileModifiedEvent],
-    )
+    handler = FileChangeHandler(filepath, callback, observer)
+    observer.schedule(handler, path=str(filepath.parent), event_filter=handler.event_filter)
     observer.start()
 
 
@@ -126,40 +264,122 @@ def watch_file(filepath: FilePath, callback: Callable[[FilePath], None]) -> None
     def watch() -> None:
         """If modification time of `filepath` changes call `callback`."""
         last_modified = 0
-        app.logger.info(f"watch {filepath} for changes")
+        path = os.fspath(filepath)
+        app.logger.info("watch %s for changes", filepath)
         while True:
-            app.logger.debug(f"check modification time of {filepath}")
+            app.logger.debug("check modification time of %s", filepath)
             try:
-                modified = filepath.stat().st_mtime_ns
+                modified = os.stat(path).st_mtime_ns  # noqa: PTH116
             except FileNotFoundError as e:
-                app.logger.error(f"cannot get last modification time of {filepath}: {e!s}")
+                app.logger.error("cannot get last modification time of %s: %s", filepath, e)
             else:
                 if last_modified < modified:
                     last_modified = modified
                     callback(filepath)
-            event.wait(5)
+            event.wait(settings.watch_interval_seconds)
 
     event = threading.Event()
     threading.Thread(target=watch, daemon=True).start()
 
 
+#
+# File watch based on inotify (Linux only).
+#
+class INotifyWatcher:
+    """Watch the directory of `filepath`, and of its real path, with inotify and call `callback` on change."""
+
+    def __init__(self, filepath: FilePath, callback: Callable[[FilePath], None]) -> None:
+        """Set the filepath of the file to watch and add the inotify watches."""
+        self.filepath = filepath
+        self.callback = callback
+        self.parent_realpath = os.path.realpath(filepath.parent)
+        # also catches a Kubernetes ConfigMap update, that atomically renames the ..data symlink
+        self.mask = flags.CLOSE_WRITE | flags.MOVED_TO
+        self.target_dir: str | None = None
+        self.target_wd: int | None = None
+        self.inotify = INotify()
+        try:
+            self.parent_wd = self.inotify.add_watch(filepath.parent, self.mask)
+            self.resolve()
+        except OSError:
+            self.inotify.close()
+            raise
+
+    def resolve(self) -> None:
+        """Watch the directory of the real path of `filepath`, it changes when a symlink on the way is replaced."""
+        target_dir, _, self.target_name = os.path.realpath(self.filepath).rpartition(os.sep)
+        if target_dir == self.target_dir:
+            return
+        if self.target_wd is not None:
+            with contextlib.suppress(OSError):  # directory is already removed
+                self.inotify.rm_watch(self.target_wd)
+            self.target_wd = None
+        self.target_dir = target_dir
+        if target_dir != self.parent_realpath:
+            app.logger.info("watch %s for changes", os.path.join(target_dir, self.target_name))  # noqa: PTH118
+            self.target_wd = self.inotify.add_watch(target_dir, self.mask)
+
+    def is_change(self, event: Any) -> bool:  # noqa: ANN401
+        """Return whether the inotify `event` may have changed the contents of `filepath`."""
+        if event.mask & (flags.MOVED_TO | flags.Q_OVERFLOW | flags.IGNORED):
+            return True
+        if event.wd == self.parent_wd:
+            return event.name == self.filepath.name or (self.target_wd is None and event.name == self.target_name)
+        return event.wd == self.target_wd and event.name == self.target_name
+
+    def watch(self) -> None:
+        """Block until files are written or moved into place and call `callback`."""
+        app.logger.info("watch %s for changes", self.filepath)
+        self.callback(self.filepath)
+        while True:
+            events = self.inotify.read()
+            app.logger.debug("inotify %s", events)
+            if any(event.mask & (flags.MOVED_TO | flags.Q_OVERFLOW | flags.IGNORED) for event in events):
+                try:
+                    self.resolve()
+                except OSError as e:
+                    app.logger.warning("cannot watch real path of %s with inotify: %s", self.filepath, e)
+            if any(map(self.is_change, events)):
+                self.callback(self.filepath)
+
+
+def inotify_file(filepath: FilePath, callback: Callable[[FilePath], None]) -> None:
+    """Watch `filepath` with inotify in a thread and call `callback` on change, fall back to polling on error."""
+    try:
+        watcher = INotifyWatcher(filepath, callback)
+    except OSError as e:
+        app.logger.warning("cannot watch %s with inotify, fall back to polling: %s", filepath, e)
+        watch_file(filepath, callback)
+        return
+    threading.Thread(target=watcher.watch, daemon=True).start()
+
+
 #
 # Load DN from file.
 #
 def load_allowed_client_dn(filepath: FilePath) -> None:
-    """Load list of allowed client DN from file."""
-    try:
-        with filepath.open("r") as f:
-            new_allowed_client_subject_dn = [line.strip() for line in f if line.strip()]
-    except Exception as e:
-        app.logger.error(f"cannot load allowed client DN from {filepath}: {e!s}")
-    else:
-        if state.allowed_client_subject_dn != new_allowed_client_subject_dn:
-            state.allowed_client_subject_dn = new_allowed_client_subject_dn
-            app.logger.info(f"load {len(new_allowed_client_subject_dn)} DN from {filepath}")
+    """Load set of allowed client DN from file."""
+    with allowed_client_subject_dn_lock:
+        try:
+            stat = filepath.stat()
+            if (stat.st_mtime_ns, stat.st_size) == allowed_client_subject_dn_stat[0]:
+                app.logger.debug("%s is unchanged", filepath)
+                return
+            lines = filepath.read_text(encoding="utf-8").splitlines()
+            dns = filter(None, map(str.strip, lines))
+            new_allowed_client_subject_dn = frozenset(map(wsgi_str, map(str.casefold, dns) if _DN_NORMALIZE else dns))
+        except Exception as e:
+            app.logger.error("cannot load allowed client DN from %s: %s", filepath, e)
+        else:
+            allowed_client_subject_dn_stat[0] = (stat.st_mtime_ns, stat.st_size)
+            if allowed_client_subject_dn[0] != new_allowed_client_subject_dn:
+                allowed_client_subject_dn[0] = new_allowed_client_subject_dn
+                app.logger.info("load %d DN from %s", len(new_allowed_client_subject_dn), filepath)
 
 
 if settings.use_watchdog:
     watchdog_file(settings.allowed_client_subject_dn_path, load_allowed_client_dn)
+elif settings.use_inotify and INotify is not None and sys.platform == "linux":
+    inotify_file(settings.allowed_client_subject_dn_path, load_allowed_client_dn)
 else:
     watch_file(settings.allowed_client_subject_dn_path, load_allowed_client_dn)
@@ -0,0 +1,8 @@
+import os
+import tempfile
+from pathlib import Path
+
+# nsi_auth reads its settings and loads the allowed client DN at import, point it to a temporary file
+_allowed_client_dn_path = Path(tempfile.mkdtemp()) / "allowed_client_dn.txt"
+_allowed_client_dn_path.write_text("CN=CertA,OU=Dept X,O=Company 1,C=NL\n")
+os.environ["ALLOWED_CLIENT_SUBJECT_DN_PATH"] = str(_allowed_client_dn_path)
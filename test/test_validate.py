@@ -0,0 +1,68 @@
+from collections.abc import Iterator
+
+import pytest
+from werkzeug.test import Client
+
+import nsi_auth
+
+ALLOWED_DN = "CN=CertA,OU=Dept X,O=Company 1,C=NL"
+DENIED_DN = "CN=CertB,OU=Dept Y,O=Company 2,C=NL"
+
+
+@pytest.fixture
+def client() -> Iterator[Client]:
+    """Return a test client for the app with a known set of allowed client DN."""
+    saved = nsi_auth.allowed_client_subject_dn[0]
+    nsi_auth.allowed_client_subject_dn[0] = frozenset({ALLOWED_DN})
+    yield Client(nsi_auth.app)
+    nsi_auth.allowed_client_subject_dn[0] = saved
+
+
+def test_get_allowed_dn(client: Client) -> None:
+    """An allowed DN is answered with 200 OK."""
+    response = client.get("/validate", headers={"ssl-client-subject-dn": ALLOWED_DN})
+    assert response.status_code == 200
+    assert response.data == b"OK"
+
+
+def test_get_denied_dn(client: Client) -> None:
+    """A DN that is not allowed is answered with 403 Forbidden."""
+    response = client.get("/validate", headers={"ssl-client-subject-dn": DENIED_DN})
+    assert response.status_code == 403
+    assert response.data == b"Forbidden"
+
+
+def test_get_missing_header(client: Client) -> None:
+    """A request without DN header is answered with 403 Forbidden."""
+    response = client.get("/validate")
+    assert response.status_code == 403
+    assert response.data == b"Forbidden"
+
+
+def test_head(client: Client) -> None:
+    """HEAD has the headers of GET but an empty body."""
+    response = client.head("/validate", headers={"ssl-client-subject-dn": ALLOWED_DN})
+    assert response.status_code == 200
+    assert response.headers["Content-Length"] == "2"
+    assert response.data == b""
+
+
+def test_options(client: Client) -> None:
+    """OPTIONS lists the allowed methods."""
+    response = client.options("/validate")
+    assert response.status_code == 200
+    assert response.headers["Allow"] == "GET, HEAD, OPTIONS"
+
+
+def test_post_not_allowed(client: Client) -> None:
+    """Other methods are answered with 405 Method Not Allowed."""
+    response = client.post("/validate", headers={"ssl-client-subject-dn": ALLOWED_DN})
+    assert response.status_code == 405
+    assert response.headers["Allow"] == "GET, HEAD, OPTIONS"
+
+
+@pytest.mark.parametrize("path", ["/validate/", "/other"])
+def test_other_paths_go_to_flask(client: Client, path: str) -> None:
+    """Other paths are passed on to Flask, that has no routes for them."""
+    response = client.get(path, headers={"ssl-client-subject-dn": ALLOWED_DN})
+    assert response.status_code == 404